@@ -1,14 +1,28 @@
 
 import os
 import re
+import asyncio
 import json 
+import logging
+import hashlib
 import time 
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict, Any, Tuple
 
-import requests
-from fastapi import FastAPI, HTTPException, Header, Depends, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+import httpx
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+logger = logging.getLogger(__name__)
 
 # ------------------------- 
 # Config
@@ -22,16 +36,57 @@ LOADS_FILE = os.getenv("LOADS_FILE", "./data/loads.json")
 MAX_OVER_PCT = float(os.getenv("MAX_OVER_PCT", "0.10"))  # techo = board * (1 + 10%)
 PUBLIC_DASHBOARD = os.getenv("PUBLIC_DASHBOARD", "false").lower() == "true"
 
+MAX_AUTH_BATCH = 50  # MCs por llamada a /api/authenticate_batch
+
+# Límites de memoria de los stores en proceso
+MAX_CALL_RESULTS = int(os.getenv("MAX_CALL_RESULTS", "10000"))
+NEGOTIATION_TTL_SECONDS = 3600          # negociaciones abiertas sin actividad
+SETTLED_NEGOTIATION_TTL_SECONDS = 600   # negociaciones ya cerradas
+NEGOTIATION_SWEEP_EVERY = 100           # escrituras entre barridos
+
 # NLP del transcript en /api/call/result
 ENABLE_NLP = os.getenv("ENABLE_NLP", "true").lower() == "true"
 
 # -------------------------
 # App & Stores
 # -------------------------
-app = FastAPI(title="HappyRobot - Inbound Carrier API (V15 Dashboard+)") 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cliente HTTP compartido: pool de conexiones keep-alive (HTTP/2) hacia FMCSA.
+    # keepalive_expiry alto: los cache-miss son esporádicos y con el default (5s) casi siempre habría handshake TLS nuevo
+    global _http, _loop
+    _loop = asyncio.get_running_loop()
+    _http = httpx.AsyncClient(
+        http2=True,
+        timeout=8.0,
+        limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=60.0),
+    )
+    loads_watcher = start_loads_watcher()
+    try:
+        yield
+    finally:
+        if loads_watcher is not None:
+            loads_watcher.stop()
+            loads_watcher.join(timeout=2)
+        await _http.aclose()
+        _http = None
+
+app = FastAPI(title="HappyRobot - Inbound Carrier API (V15 Dashboard+)", lifespan=lifespan) 
+app.add_middleware(GZipMiddleware, minimum_size=500)
 
 negotiations: Dict[str, Dict[str, Any]] = {}     # key = f"{mc}:{load_id}"
-call_results: List[Dict[str, Any]] = []          # para dashboard
+call_results: "deque[Dict[str, Any]]" = deque(maxlen=MAX_CALL_RESULTS)  # para dashboard (las más antiguas se descartan)
+_negotiation_writes = 0
+
+# Agregados diarios incrementales (se actualizan en cada /api/call/result)
+_daily: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"acc": 0, "rej": 0, "total": 0.0, "acc_total": 0.0, "bm": 0})
+_sorted_days: List[str] = []           # claves de _daily ordenadas, para consultas por rango con bisect
+_calls_lock = threading.Lock()
+
+# SSE del dashboard: versión de los datos + evento que despierta a los streams abiertos
+_dashboard_version = 0
+_dashboard_changed = asyncio.Event()
+_loop: Optional[asyncio.AbstractEventLoop] = None  # loop de la app, para notificar desde el threadpool
 
 metrics = {
     "calls_total": 0,
@@ -46,6 +101,9 @@ metrics = {
 class CarrierIn(BaseModel):
     mc_number: str
 
+class CarrierBatchIn(BaseModel):
+    mc_numbers: List[str]
+
 class LoadOut(BaseModel):
     load_id: str
     origin: str
@@ -83,28 +141,105 @@ def require_api_key(x_api_key: str = Header(...)):
 # -------------------------
 # Utilidades
 # -------------------------
-def load_loads() -> List[Dict[str, Any]]:
-    if not os.path.exists(LOADS_FILE):
-        return []
-    with open(LOADS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Snapshot inmutable de las cargas; lo sustituye entero el watcher cuando cambia LOADS_FILE
+_loads_cache: Dict[str, Any] = {"data": [], "by_id": {}, "rows": []}
+_loads_lock = threading.Lock()
+
+def _index_loads(data: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Normaliza loadboard_rate a float una sola vez y construye el índice load_id -> load."""
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for l in data:
+        try:
+            l["loadboard_rate"] = float(l.get("loadboard_rate", 0))
+        except (TypeError, ValueError):
+            l["loadboard_rate"] = None
+        by_id[str(l.get("load_id")).strip()] = l
+    return by_id
+
+def _search_rows(data: List[Dict[str, Any]]) -> List[Tuple[str, str, Optional[float], Dict[str, Any]]]:
+    """Precalcula (origin_lc, destination_lc, miles_f, load) para filtrar /api/loads sin .lower()/float() por request."""
+    rows = []
+    for l in data:
+        miles = l.get("miles")
+        try:
+            miles_f = float(miles) if miles else None
+        except (TypeError, ValueError):
+            miles_f = None
+        rows.append(((l.get("origin") or "").lower(), (l.get("destination") or "").lower(), miles_f, l))
+    return rows
+
+def refresh_loads():
+    """Re-parsea LOADS_FILE y publica un snapshot nuevo (asignar la referencia es atómico)."""
+    global _loads_cache
+    with _loads_lock:
+        data: List[Dict[str, Any]] = []
+        if os.path.exists(LOADS_FILE):
+            with open(LOADS_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        if not isinstance(data, list) or not all(isinstance(l, dict) for l in data):
+            raise ValueError(f"{LOADS_FILE} must contain a JSON list of load objects")
+        _loads_cache = {"data": data, "by_id": _index_loads(data), "rows": _search_rows(data)}
+
+class _LoadsFileHandler(FileSystemEventHandler):
+    def on_any_event(self, event):
+        if event.event_type not in ("modified", "created", "moved", "deleted"):
+            return
+        target = os.path.abspath(LOADS_FILE)
+        paths = (event.src_path, getattr(event, "dest_path", ""))
+        if not any(p and os.path.abspath(p) == target for p in paths):
+            return
+        # Cualquier excepción aquí mataría el hilo del Observer: la registramos y seguimos vigilando.
+        # Nos quedamos con el snapshot anterior hasta la siguiente escritura válida.
+        try:
+            refresh_loads()
+        except Exception:
+            logger.exception("Could not reload %s; keeping previous loads", LOADS_FILE)
+
+def start_loads_watcher() -> Optional[Observer]:
+    """Vigila el directorio de LOADS_FILE (inotify en Linux) y refresca el snapshot al cambiar."""
+    watch_dir = os.path.dirname(os.path.abspath(LOADS_FILE))
+    if not os.path.isdir(watch_dir):
+        logger.warning("Directory %s does not exist; %s will not be reloaded until restart", watch_dir, LOADS_FILE)
+        return None
+    observer = Observer()
+    observer.schedule(_LoadsFileHandler(), watch_dir, recursive=False)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+def get_load(load_id: Any) -> Optional[Dict[str, Any]]:
+    """Lookup O(1) por load_id sobre el índice cacheado."""
+    return _loads_cache["by_id"].get(str(load_id).strip())
+
+# Un loads.json inválido no debe impedir arrancar: se sirve vacío hasta que el watcher vea uno válido
+try:
+    refresh_loads()
+except Exception:
+    logger.exception("Could not load %s at startup; serving no loads", LOADS_FILE)
 
 _num_re = re.compile(r"(-?\d{1,7}(?:\.\d{1,2})?)")
+_plain_amount_re = re.compile(r"-?\d{1,7}(?:\.\d{1,2})?", re.ASCII)  # anclado con fullmatch: solo dígitos y punto
+_amt_trans = str.maketrans("", "", "$,")
 
 def parse_amount(value: Any) -> float:
     """Convierte oferta a float. Soporta '1600', '$1,600', '1600.00'."""
     if isinstance(value, (int, float)):
         return float(value)
     if isinstance(value, str):
-        s = value.strip().replace(",", "").replace("$", "")
+        # Camino rápido: string numérico limpio (no acepta '1e5', '1_600', 'nan'...)
+        if _plain_amount_re.fullmatch(value):
+            return float(value)
+        s = value.translate(_amt_trans).strip()
         m = _num_re.search(s)
         if m:
             return float(m.group(1))
     raise HTTPException(status_code=422, detail="Invalid offer: must be a numeric amount")
 
-price_re = re.compile(r"\b(?:\$)?\s*(\d{2,6}(?:\.\d{1,2})?)\b")
-mc_re = re.compile(r"\bMC(?:\s|#|:)?\s*(\d{4,10})\b", re.IGNORECASE)
-loadid_re = re.compile(r"\bL\d{3,}\b", re.IGNORECASE)
+# Admite separadores de miles ("1,350") sin tener que copiar el transcript entero con replace().
+# Un solo grupo (máx. 6 dígitos, como \d{2,6}); los lookarounds descartan trozos de números más largos ("12,345,678")
+price_re = re.compile(r"\b(?:\$)?\s*(?<!\d,)((?:\d{1,3},\d{3}|\d{2,6})(?:\.\d{1,2})?)\b(?!,\d)", re.ASCII)
+mc_re = re.compile(r"\bMC(?:\s|#|:)?\s*(\d{4,10})\b", re.IGNORECASE | re.ASCII)
+loadid_re = re.compile(r"\bL\d{3,}\b", re.IGNORECASE | re.ASCII)
 
 def extract_entities_from_text(text: str) -> Dict[str, Any]:
     if not ENABLE_NLP:
@@ -112,22 +247,28 @@ def extract_entities_from_text(text: str) -> Dict[str, Any]:
     t = text or ""
     out: Dict[str, Any] = {}
     if (m := mc_re.search(t)): out["mc_number"] = m.group(1)
-    if (m := price_re.search(t.replace(",", ""))): out["price"] = float(m.group(1))
+    if (m := price_re.search(t)): out["price"] = float(m.group(1).replace(",", ""))
     if (m := loadid_re.search(t)): out["load_id"] = m.group(0)
     return out
 
+_pos_re = re.compile(r"\b(?:good|great|ok|thanks?|yes|happy|accept)\b")
+_neg_re = re.compile(r"\b(?:no|not|reject|angry|bad|hate|problem|can'?t|cannot)\b")
+
 def simple_sentiment(text: str) -> str:
     if not ENABLE_NLP:
         return "neutral"
     if not text:
         return "neutral"
     t = text.lower()
-    pos = sum(t.count(tok) for tok in ["good", "great", "ok", "thanks", "thank", "yes", "happy", "accept"])
-    neg = sum(t.count(tok) for tok in ["no", "not", "reject", "angry", "bad", "hate", "problem", "can't", "cannot"])
+    pos = len(_pos_re.findall(t))
+    neg = len(_neg_re.findall(t))
     return "positive" if pos > neg else ("negative" if neg > pos else "neutral")
 
-_fmcsa_cache: Dict[str, Dict[str, Any]] = {}
 CACHE_TTL_SECONDS = 24 * 3600
+# LRU acotado + TTL por entrada: las entradas caducadas se purgan solas y la memoria no crece sin límite
+_fmcsa_cache: "TTLCache[str, Dict[str, Any]]" = TTLCache(maxsize=4096, ttl=CACHE_TTL_SECONDS)
+_http: Optional[httpx.AsyncClient] = None  # se crea en el lifespan de la app
+_inflight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}  # single-flight: una petición FMCSA por MC
 
 def _mock_snapshot(mc: str) -> Dict[str, Any]:
     return {
@@ -139,20 +280,30 @@ def _mock_snapshot(mc: str) -> Dict[str, Any]:
         "source": "mock"
     }
 
-def fmcs_lookup_by_mc(mc_number: str) -> Dict[str, Any]:
+async def fmcs_lookup_by_mc(mc_number: str) -> Dict[str, Any]:
     mc = mc_number.strip()
-    entry = _fmcsa_cache.get(mc)
-    if entry and (time.time() - entry["ts"] < CACHE_TTL_SECONDS):
-        return entry["data"]
+    data = _fmcsa_cache.get(mc)
+    if data is not None:
+        return data
 
     if not FMCSA_WEBKEY:
         data = _mock_snapshot(mc)
-        _fmcsa_cache[mc] = {"ts": time.time(), "data": data}
+        _fmcsa_cache[mc] = data
         return data
 
+    # Si ya hay una petición en curso para este MC, esperamos su resultado en vez de lanzar otra.
+    # shield: si se cancela un request, la petición compartida sigue para el resto.
+    task = _inflight.get(mc)
+    if task is None:
+        task = asyncio.create_task(_fetch_snapshot(mc))
+        _inflight[mc] = task
+        task.add_done_callback(lambda _t: _inflight.pop(mc, None))
+    return await asyncio.shield(task)
+
+async def _fetch_snapshot(mc: str) -> Dict[str, Any]:
     try:
         url = f"{FMCSA_BASE_URL}companySnapshot?webKey={FMCSA_WEBKEY}&mcNumber={mc}"
-        r = requests.get(url, timeout=8)
+        r = await _http.get(url)
         r.raise_for_status()
         data = r.json()
         if isinstance(data, dict):
@@ -162,16 +313,13 @@ def fmcs_lookup_by_mc(mc_number: str) -> Dict[str, Any]:
     except Exception:
         data = _mock_snapshot(mc)
 
-    _fmcsa_cache[mc] = {"ts": time.time(), "data": data}
+    _fmcsa_cache[mc] = data
     return data
 
 # -------------------------
 # Rutas API
 # -------------------------
-@app.post("/api/authenticate", dependencies=[Depends(require_api_key)])
-def authenticate(carrier: CarrierIn):
-    metrics["calls_total"] += 1
-    snapshot = fmcs_lookup_by_mc(carrier.mc_number)
+def _is_eligible(snapshot: Any) -> bool:
     allowed = True
     if isinstance(snapshot, dict):
         allow = snapshot.get("allowToOperate")
@@ -180,7 +328,28 @@ def authenticate(carrier: CarrierIn):
         if snapshot.get("source") != "mock":
             if str(allow).lower() not in ("y", "yes", "true") or str(out).lower() in ("y", "yes", "true"):
                 allowed = False
-    return {"eligible": allowed, "carrier": snapshot}
+    return allowed
+
+@app.post("/api/authenticate", dependencies=[Depends(require_api_key)])
+async def authenticate(carrier: CarrierIn):
+    metrics["calls_total"] += 1
+    snapshot = await fmcs_lookup_by_mc(carrier.mc_number)
+    return {"eligible": _is_eligible(snapshot), "carrier": snapshot}
+
+@app.post("/api/authenticate_batch", dependencies=[Depends(require_api_key)])
+async def authenticate_batch(payload: CarrierBatchIn):
+    """Valida varios MC a la vez: las consultas a FMCSA van en paralelo (latencia ~ la más lenta, no la suma)."""
+    if len(payload.mc_numbers) > MAX_AUTH_BATCH:
+        raise HTTPException(status_code=422, detail=f"Too many MC numbers: max {MAX_AUTH_BATCH} per batch")
+    metrics["calls_total"] += len(payload.mc_numbers)
+    snapshots = await asyncio.gather(*(fmcs_lookup_by_mc(mc) for mc in payload.mc_numbers), return_exceptions=True)
+    results = []
+    for mc, snapshot in zip(payload.mc_numbers, snapshots):
+        if isinstance(snapshot, BaseException):  # incluye CancelledError
+            results.append({"mc_number": mc, "eligible": False, "error": "lookup failed"})
+        else:
+            results.append({"mc_number": mc, "eligible": _is_eligible(snapshot), "carrier": snapshot})
+    return {"results": results}
 
 @app.get("/api/loads", response_model=List[LoadOut], dependencies=[Depends(require_api_key)])
 def get_loads(
@@ -188,26 +357,40 @@ def get_loads(
     destination: Optional[str] = None,
     max_miles: Optional[float] = None
 ):
-    loads = load_loads()
-    def match(l):
-        if origin and origin.lower() not in l.get("origin", "").lower(): return False
-        if destination and destination.lower() not in l.get("destination", "").lower(): return False
-        if max_miles and l.get("miles") and float(l.get("miles")) > float(max_miles): return False
-        return True
-    filtered = [l for l in loads if match(l)]
-    return filtered[:10]
+    o = origin.lower() if origin else None
+    d = destination.lower() if destination else None
+    filtered = []
+    for origin_lc, destination_lc, miles_f, l in _loads_cache["rows"]:
+        if o and o not in origin_lc: continue
+        if d and d not in destination_lc: continue
+        if max_miles and miles_f is not None and miles_f > max_miles: continue
+        filtered.append(l)
+        if len(filtered) == 10: break
+    return filtered
+
+def _save_negotiation(key: str, state: Dict[str, Any]):
+    """Guarda el estado con timestamp y, cada N escrituras, purga negociaciones caducadas."""
+    global _negotiation_writes
+    state["ts"] = time.time()
+    negotiations[key] = state
+    _negotiation_writes += 1
+    if _negotiation_writes % NEGOTIATION_SWEEP_EVERY == 0:
+        now = time.time()
+        for k, st in list(negotiations.items()):
+            age = now - st.get("ts", now)
+            if age > NEGOTIATION_TTL_SECONDS or (st.get("settled") and age > SETTLED_NEGOTIATION_TTL_SECONDS):
+                negotiations.pop(k, None)
 
 @app.post("/api/negotiate", dependencies=[Depends(require_api_key)])
 def negotiate(payload: NegotiateIn):
 
     key = f"{payload.mc_number}:{payload.load_id}"
 
-    loads = load_loads()
-    load = next((l for l in loads if str(l.get("load_id")).strip() == str(payload.load_id).strip()), None)
+    load = get_load(payload.load_id)
     if not load:
         raise HTTPException(status_code=404, detail="load not found")
 
-    listed = float(load.get("loadboard_rate", 0))
+    listed = load["loadboard_rate"]
     ceiling = round(listed * (1.0 + MAX_OVER_PCT), 2)
 
     state = negotiations.get(key, {"round": 0, "settled": False})
@@ -219,7 +402,7 @@ def negotiate(payload: NegotiateIn):
     # Aceptamos si el carrier pide <= techo
     if offer <= ceiling:
         state.update({"settled": True, "price": offer})
-        negotiations[key] = state
+        _save_negotiation(key, state)
         metrics["offers_accepted"] += 1
         metrics["negotiation_rounds_total"] += state["round"]
         return {"accepted": True, "price": offer, "round": state["round"], "listed": listed, "ceiling": ceiling}
@@ -229,12 +412,12 @@ def negotiate(payload: NegotiateIn):
         metrics["offers_rejected"] += 1
         metrics["negotiation_rounds_total"] += state["round"]
         state["settled"] = False
-        negotiations[key] = state
+        _save_negotiation(key, state)
         return {"accepted": False, "reason": "max rounds reached", "round": state["round"], "listed": listed, "ceiling": ceiling}
 
     # Contra: techo
     state["round"] += 1
-    negotiations[key] = state
+    _save_negotiation(key, state)
     return {"accepted": False, "counter_offer": ceiling, "round": state["round"], "listed": listed, "ceiling": ceiling}
 
 @app.post("/api/call/result", dependencies=[Depends(require_api_key)])
@@ -258,27 +441,48 @@ def call_result(payload: CallResultIn):
     board_rate_val: Optional[float] = None
     the_load_id = payload.load_id or entities.get("load_id")
     if the_load_id:
-        loads = load_loads()
-        ld = next((l for l in loads if str(l.get("load_id")).strip() == str(the_load_id).strip()), None)
+        ld = get_load(the_load_id)
         if ld:
-            try:
-                board_rate_val = float(ld.get("loadboard_rate"))
-            except Exception:
-                board_rate_val = None
-
-    record = {
-        "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-        "mc_number": payload.mc_number or entities.get("mc_number"),
-        "load_id": the_load_id,
-        "final_price": final_price_val,
-        "accepted": payload.accepted,
-        "sentiment": sentiment,
-        "board_rate": board_rate_val,     # <-- para la tabla
-        "entities": entities,
-        "transcript": payload.transcript,
-    }
-    call_results.append(record)
-    return {"ok": True, "summary": record}
+            board_rate_val = ld["loadboard_rate"]
+
+    # ts se toma dentro del lock: así call_results queda en orden de ts y
+    # _filter_calls_by_date puede cortar el recorrido hacia atrás en cuanto sale del rango
+    with _calls_lock:
+        ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        record = {
+            "ts": ts,
+            "day": ts[:10],                   # precalculado para filtrar por rango sin slicing por fila
+            "mc_number": payload.mc_number or entities.get("mc_number"),
+            "load_id": the_load_id,
+            "final_price": final_price_val,
+            "accepted": payload.accepted,
+            "sentiment": sentiment,
+            "board_rate": board_rate_val,     # <-- para la tabla
+            "entities": entities,
+            "transcript": payload.transcript,
+        }
+        day = record["day"]
+        call_results.append(record)
+        if day not in _daily:
+            # ts sale del reloj del servidor: lo normal es que el día nuevo vaya al final
+            if not _sorted_days or day > _sorted_days[-1]:
+                _sorted_days.append(day)
+            else:
+                insort(_sorted_days, day)
+        bucket = _daily[day]
+        if final_price_val is not None:
+            bucket["total"] += final_price_val
+        if payload.accepted is True:
+            bucket["acc"] += 1
+            if final_price_val is not None:
+                bucket["acc_total"] += final_price_val
+                if final_price_val == board_rate_val:
+                    bucket["bm"] += 1
+        elif payload.accepted is False:
+            bucket["rej"] += 1
+    _notify_dashboard()
+    # "day" es interno (filtro por rango); no forma parte de la respuesta
+    return {"ok": True, "summary": {k: v for k, v in record.items() if k != "day"}}
 
 # -------------------------
 # Dashboard helpers
@@ -293,50 +497,48 @@ def _parse_range_params(from_str: Optional[str], to_str: Optional[str]) -> Tuple
         return d if len(d) == 10 and d[4] == '-' and d[7] == '-' else None
     return _valid(from_str), _valid(to_str)
 
-def _filter_calls_by_date(calls: List[Dict[str, Any]], from_date: Optional[str], to_date: Optional[str]) -> List[Dict[str, Any]]:
+def _wake_dashboard_streams():
+    # Cada espera usa el Event vigente; lo sustituimos y lo marcamos para despertar a todos
+    global _dashboard_changed
+    ev, _dashboard_changed = _dashboard_changed, asyncio.Event()
+    ev.set()
+
+def _notify_dashboard():
+    """Llamado desde el threadpool tras registrar una llamada."""
+    global _dashboard_version
+    with _calls_lock:
+        _dashboard_version += 1
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wake_dashboard_streams)
+
+def _filter_calls_by_date(calls: "deque[Dict[str, Any]]", from_date: Optional[str], to_date: Optional[str], limit: int = 10) -> List[Dict[str, Any]]:
+    """Últimas `limit` llamadas del rango. Recorre desde el final: call_results está ordenado por ts."""
     out = []
-    for r in calls:
-        day = (r.get("ts") or "")[:10]
-        if not day: continue
-        if from_date and day < from_date: continue
+    for r in reversed(calls):
+        day = r["day"]
         if to_date and day > to_date: continue
+        if from_date and day < from_date: break
         out.append(r)
+        if len(out) == limit: break
+    out.reverse()
     return out
 
-def _aggregate_by_day(calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    agg: Dict[str, Dict[str, int]] = {}
-    for r in calls:
-        day = (r.get("ts") or "")[:10]
-        if not day: continue
-        bucket = agg.setdefault(day, {"accepted": 0, "rejected": 0})
-        acc = r.get("accepted")
-        if acc is True: bucket["accepted"] += 1
-        elif acc is False: bucket["rejected"] += 1
-    return [{"date": d, **agg[d]} for d in sorted(agg.keys())]
-
-def _build_metrics_payload(filtered_calls: List[Dict[str, Any]]) -> Dict[str, Any]:
-    # Totales en el rango
-    total_accepted = sum(1 for r in filtered_calls if r.get("accepted") is True)
-    total_rejected = sum(1 for r in filtered_calls if r.get("accepted") is False)
-    calls_in_range = total_accepted + total_rejected
-
-    # Sumas de precios finales
-    total_final_sum = sum((r.get("final_price") or 0) for r in filtered_calls if r.get("final_price") is not None)
-    accepted_final_sum = sum(
-        (r.get("final_price") or 0)
-        for r in filtered_calls
-        if r.get("accepted") is True and r.get("final_price") is not None
-    )
-
+def _build_metrics_payload(from_date: Optional[str], to_date: Optional[str]) -> Dict[str, Any]:
+    # Solo se recorren los buckets diarios del rango, no el histórico de llamadas
+    with _calls_lock:
+        lo = bisect_left(_sorted_days, from_date) if from_date else 0
+        hi = bisect_right(_sorted_days, to_date) if to_date else len(_sorted_days)
+        buckets = [(d, dict(_daily[d])) for d in _sorted_days[lo:hi]]
+        recent = _filter_calls_by_date(call_results, from_date, to_date)
+
+    acc = sum(b["acc"] for _, b in buckets)
+    rej = sum(b["rej"] for _, b in buckets)
+    total_final_sum = sum((b["total"] for _, b in buckets), 0.0)
+    accepted_final_sum = sum((b["acc_total"] for _, b in buckets), 0.0)
     # Board-match: final_price == board_rate y aceptado
-    board_match_acc_count = sum(
-        1
-        for r in filtered_calls
-        if r.get("accepted") is True
-        and r.get("final_price") is not None
-        and r.get("board_rate") is not None
-        and float(r.get("final_price")) == float(r.get("board_rate"))
-    )
+    board_match_acc_count = sum(b["bm"] for _, b in buckets)
+
+    calls_in_range = acc + rej
     board_match_rate_pct = (board_match_acc_count / calls_in_range * 100.0) if calls_in_range > 0 else None
 
     return {
@@ -346,21 +548,22 @@ def _build_metrics_payload(filtered_calls: List[Dict[str, Any]]) -> Dict[str, An
             "offers_rejected": metrics["offers_rejected"],
         },
         "calls_logged": calls_in_range,
-        "recent_calls": filtered_calls[-10:],
+        # La tabla no muestra el transcript (ni "day", que es interno): no los mandamos en cada refresco
+        "recent_calls": [{k: v for k, v in r.items() if k not in ("transcript", "day")} for r in recent],
         "total_final_sum": round(total_final_sum, 2),
         "accepted_final_sum": round(accepted_final_sum, 2),
         "board_match_accepted_count": board_match_acc_count,
         "board_match_rate_percent": round(board_match_rate_pct, 1) if board_match_rate_pct is not None else None,
+        "accepted_in_range": acc,
+        "rejected_in_range": rej,
+        "daily_counts": [{"date": d, "accepted": b["acc"], "rejected": b["rej"]} for d, b in buckets],
     }
 
 
 # -------------------------
 # Dashboard routes
 # -------------------------
-@app.get("/dashboard", response_class=HTMLResponse)
-def dashboard_page():
-    _assert_public_dashboard()
-    html = """
+_DASHBOARD_HTML = """
 <!doctype html>
 <html>
 <head>
@@ -481,7 +684,7 @@ def dashboard_page():
     const btnToday=document.getElementById('qToday');
     const btnClear=document.getElementById('qClear');
 
-    let isLoading = false; // evita solapes
+    let stream = null; // EventSource activo (uno por rango)
 
     function fmtYmdUTC(d){
       const y = d.getUTCFullYear();
@@ -496,16 +699,16 @@ def dashboard_page():
       from.setUTCDate(to.getUTCDate() - (days-1));
       elFrom.value = fmtYmdUTC(from);
       elTo.value   = fmtYmdUTC(to);
-      loadData();
+      openStream();
     }
     function setToday(){
       const now = new Date();
       const d = new Date(Date.UTC(now.getUTCFullYear(), now.getUTCMonth(), now.getUTCDate()));
       const ymd = fmtYmdUTC(d);
       elFrom.value = ymd; elTo.value = ymd;
-      loadData();
+      openStream();
     }
-    function clearFilters(){ elFrom.value=''; elTo.value=''; loadData(); }
+    function clearFilters(){ elFrom.value=''; elTo.value=''; openStream(); }
 
     function qs(){
       const p = new URLSearchParams();
@@ -515,51 +718,48 @@ def dashboard_page():
       return s ? ('?' + s) : '';
     }
 
-    async function loadData(){
-      if (isLoading) return;
-      isLoading = true;
-      try{
-        const res = await fetch('/dashboard/data' + qs());
-        if(!res.ok){ isLoading = false; return; }
-        const j = await res.json();
-
-        // KPIs
-        const calls = j.calls_logged || 0;
-        const acc   = j.accepted_in_range || 0;
-        const rej   = j.rejected_in_range || 0;
-        elCalls.textContent = calls;
-        elAcc.textContent   = acc;
-        elRej.textContent   = rej;
-        elRate.textContent  = calls ? ((acc / calls) * 100).toFixed(1) + '%' : '–';
-
-        elSumAll.textContent = '$' + (j.total_final_sum ?? 0).toLocaleString();
-        elSumAcc.textContent = '$' + (j.accepted_final_sum ?? 0).toLocaleString();
-
-        elBMatchCount.textContent = (j.board_match_accepted_count ?? 0);
-        elBMatchRate.textContent  = (j.board_match_rate_percent != null) ? (j.board_match_rate_percent.toFixed(1) + '%') : '–';
-
-        // Tabla
-        elTbody.innerHTML = '';
-        (j.recent_calls||[]).slice().reverse().forEach(r=>{
-          const tr = document.createElement('tr');
-          const accTxt = r.accepted === true ? '<span class="ok">Yes</span>' : (r.accepted === false ? '<span class="bad">No</span>' : '<span class="muted">–</span>');
-          tr.innerHTML = `
-            <td>${r.ts ?? ''}</td>
-            <td>${r.mc_number ?? ''}</td>
-            <td>${r.load_id ?? ''}</td>
-            <td>${r.board_rate != null ? ('$'+ Number(r.board_rate).toLocaleString()) : ''}</td>
-            <td>${r.final_price != null ? ('$'+ Number(r.final_price).toLocaleString()) : ''}</td>
-            <td>${accTxt}</td>
-            <td>${r.sentiment ?? ''}</td>
-          `;
-          elTbody.appendChild(tr);
-        });
-
-        drawBars(j.daily_counts || []);
-        drawPie(j.total_final_sum || 0, j.accepted_final_sum || 0);
-      } finally{
-        isLoading = false;
-      }
+    // El servidor empuja las métricas del rango al conectar y en cada call result nuevo
+    function openStream(){
+      if (stream) stream.close();
+      stream = new EventSource('/dashboard/stream' + qs());
+      stream.onmessage = (e) => render(JSON.parse(e.data));
+    }
+
+    function render(j){
+      // KPIs
+      const calls = j.calls_logged || 0;
+      const acc   = j.accepted_in_range || 0;
+      const rej   = j.rejected_in_range || 0;
+      elCalls.textContent = calls;
+      elAcc.textContent   = acc;
+      elRej.textContent   = rej;
+      elRate.textContent  = calls ? ((acc / calls) * 100).toFixed(1) + '%' : '–';
+
+      elSumAll.textContent = '$' + (j.total_final_sum ?? 0).toLocaleString();
+      elSumAcc.textContent = '$' + (j.accepted_final_sum ?? 0).toLocaleString();
+
+      elBMatchCount.textContent = (j.board_match_accepted_count ?? 0);
+      elBMatchRate.textContent  = (j.board_match_rate_percent != null) ? (j.board_match_rate_percent.toFixed(1) + '%') : '–';
+
+      // Tabla
+      elTbody.innerHTML = '';
+      (j.recent_calls||[]).slice().reverse().forEach(r=>{
+        const tr = document.createElement('tr');
+        const accTxt = r.accepted === true ? '<span class="ok">Yes</span>' : (r.accepted === false ? '<span class="bad">No</span>' : '<span class="muted">–</span>');
+        tr.innerHTML = `
+          <td>${r.ts ?? ''}</td>
+          <td>${r.mc_number ?? ''}</td>
+          <td>${r.load_id ?? ''}</td>
+          <td>${r.board_rate != null ? ('$'+ Number(r.board_rate).toLocaleString()) : ''}</td>
+          <td>${r.final_price != null ? ('$'+ Number(r.final_price).toLocaleString()) : ''}</td>
+          <td>${accTxt}</td>
+          <td>${r.sentiment ?? ''}</td>
+        `;
+        elTbody.appendChild(tr);
+      });
+
+      drawBars(j.daily_counts || []);
+      drawPie(j.total_final_sum || 0, j.accepted_final_sum || 0);
     }
 
     function drawBars(rows){
@@ -683,44 +883,69 @@ def dashboard_page():
     }
 
     // Eventos
-    elApply.addEventListener('click', loadData);
+    elApply.addEventListener('click', openStream);
     btn7.addEventListener('click', () => setRangeDays(7));
     btn14.addEventListener('click', () => setRangeDays(14));
     btn30.addEventListener('click', () => setRangeDays(30));
     btnToday.addEventListener('click', setToday);
     btnClear.addEventListener('click', clearFilters);
 
-    // Carga inicial + auto-refresh silencioso
-    loadData();
-    setInterval(loadData, 5000);
+    // Carga inicial; a partir de aquí las actualizaciones llegan por SSE
+    openStream();
   </script>
 </body>
 </html>
-    """
-    return HTMLResponse(html)
+"""
+# Se codifica una sola vez al importar; el handler sirve los bytes tal cual
+_DASHBOARD_HTML_BYTES = _DASHBOARD_HTML.encode("utf-8")
+
+@app.get("/dashboard", response_class=HTMLResponse)
+def dashboard_page():
+    _assert_public_dashboard()
+    return Response(content=_DASHBOARD_HTML_BYTES, media_type="text/html", headers={"Cache-Control": "public, max-age=300"})
 
 @app.get("/dashboard/data", response_class=JSONResponse)
 def dashboard_data(
+    request: Request,
+    from_date: Optional[str] = Query(default=None, alias="from"),
+    to_date: Optional[str] = Query(default=None, alias="to"),
+):
+    _assert_public_dashboard()
+    f, t = _parse_range_params(from_date, to_date)
+    payload = _build_metrics_payload(f, t)
+
+    # ETag sobre el cuerpo: si el navegador ya tiene esta versión respondemos 304 sin cuerpo
+    body = orjson.dumps(payload)
+    etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "max-age=2"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/dashboard/stream")
+async def dashboard_stream(
+    request: Request,
     from_date: Optional[str] = Query(default=None, alias="from"),
     to_date: Optional[str] = Query(default=None, alias="to"),
 ):
+    """Server-Sent Events: envía las métricas del rango al conectar y cada vez que llega un call result."""
     _assert_public_dashboard()
     f, t = _parse_range_params(from_date, to_date)
-    filtered = _filter_calls_by_date(call_results, f, t)
-    daily = _aggregate_by_day(filtered)
 
-    # totales básicos (necesarios para KPIs clásicos)
-    acc = sum(1 for r in filtered if r.get("accepted") is True)
-    rej = sum(1 for r in filtered if r.get("accepted") is False)
+    async def events():
+        sent_version = None
+        while not await request.is_disconnected():
+            ev = _dashboard_changed
+            if sent_version != _dashboard_version:
+                sent_version = _dashboard_version
+                payload = _build_metrics_payload(f, t)
+                yield b"data: " + orjson.dumps(payload) + b"\n\n"
+            try:
+                await asyncio.wait_for(ev.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"  # keep-alive para proxies
 
-    # payload extendido con nuevas métricas
-    payload = _build_metrics_payload(filtered)
-    payload.update({
-        "accepted_in_range": acc,
-        "rejected_in_range": rej,
-        "daily_counts": daily
-    })
-    return JSONResponse(payload)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # -------------------------
 # Raíz (health)
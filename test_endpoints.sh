@@ -12,6 +12,14 @@ curl -X POST "http://127.0.0.1:8000/api/authenticate" \
   -d '{"mc_number":"123456"}'
 echo "\n"
 
+# 1️⃣b Authenticate several carriers at once
+echo "1️⃣b Authenticate carriers (batch)"
+curl -X POST "http://127.0.0.1:8000/api/authenticate_batch" \
+  -H "Content-Type: application/json" \
+  -H "x-api-key: test-api-key" \
+  -d '{"mc_numbers":["123456","654321"]}'
+echo "\n"
+
 # 2️⃣ Get available loads
 echo "2️⃣ Get available loads"
 curl -X GET "http://127.0.0.1:8000/api/loads" \